@@ -1,147 +1,492 @@
 import os
-from typing import Dict, Any, List
+import re
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+import tiktoken
+import msgspec
+import lxml.html
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
 
-from state import AgentState, ResearchPlan, Feedback
+from state import AgentState, ResearchPlan, SearchQuery, Feedback
 from tools import ToolManager
 
 load_dotenv()
 
-# Initialize LLM
-# Using available model from user environment (1.5-flash is 404)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite", 
-    temperature=0,
-    google_api_key=os.getenv("GOOGLE_API_KEY")
+# Max Tavily searches in flight per run; keeps a wide plan under the API rate limit.
+PLAN_CONCURRENCY = 4
+
+# Per-source content cap (UTF-8 bytes) applied when results enter state.
+MAX_SNIPPET_BYTES = 4000
+
+# Search results kept (and cached) per plan query.
+RESULTS_PER_QUERY = 2
+
+# Real HTML tags; plain text with '<'/'>' (generics, comparisons) must not go through lxml.
+# Opening <b>/<i>/<u> are left out so "a<b and c>d" stays plain text; their closing tags aren't.
+_HTML_TAG_RE = re.compile(
+    r'</[biu]>|</?(a|p|br|hr|img|div|span|strong|em|small|sup|sub|code|pre|blockquote|'
+    r'section|article|header|footer|nav|aside|main|figure|figcaption|'
+    r'li|ul|ol|dl|dt|dd|h[1-6]|table|thead|tbody|tr|th|td|'
+    r'html|head|body|meta|link|script|style|noscript|iframe|svg|form|button|input|label)\b[^<>]*>',
+    re.I
 )
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Token budget for research content in the writer prompt; sources past it get summarized.
+WRITER_CONTEXT_TOKEN_BUDGET = 12000
+SUMMARY_CONCURRENCY = 4
+
+# The writer reviews and revises its own draft, so the critique normally runs once;
+# raise this to allow extra research -> writer passes. The LLM editor only runs when
+# its score can still trigger one of those passes.
+MAX_CRITIQUE_ROUNDS = 1
+
+# Structural failures instead send the draft back to the writer for a repair pass;
+# these don't count against MAX_CRITIQUE_ROUNDS.
+MAX_REPAIR_PASSES = 1
+
+# Thinking tokens for the writer's private self-review (flash-lite thinks only when asked).
+WRITER_THINKING_BUDGET = 1024
+
+# Drafts failing the structural pre-check get this score without an LLM critique.
+MIN_DRAFT_TOKENS = 300
+STRUCTURAL_FAIL_SCORE = 40
+
+# Score used when the editor's reply can't be decoded. The draft already passed the
+# structural checks, so an unreadable review shouldn't force another pass.
+UNPARSED_CRITIQUE_SCORE = 75
+
+# Static system prompts, kept together so they are easy to find and edit.
+PLANNER_SYSTEM_PROMPT = "You are a Senior Research Planner. Breakdown the user topic into 3-5 distinct, actionable search queries to gather comprehensive information."
+
+WRITER_SYSTEM_PROMPT = (
+    "You are a Professional Technical Writer. Synthesize the provided research data into a comprehensive Markdown report.\n\n"
+    "Follow these rules STRICTLY:\n"
+    "1. Start with a clear level 1 header (# Title) for the report title.\n"
+    "2. Use level 2 headers (## Section) for main sections and level 3 (### Subsection) for subsections.\n"
+    "3. Use bolding (**bold**) for key terms and important concepts.\n"
+    "4. Ensure there is a blank line between every paragraph and list item for proper spacing.\n"
+    "5. Use bullet points for lists of features or takeaways.\n"
+    "6. Cite sources inline using [Source Title](URL) format.\n"
+    "7. Add a 'References' section at the end.\n"
+    "8. Do NOT output raw text blocks without formatting. Make it visually structured and easy to read.\n\n"
+    "Before answering, use your thinking to review the report: check it against every rule above, confirm each claim is supported by the research data, "
+    "and rate it 0-100 for completeness and accuracy. If it would score below 70, revise it until it would not.\n"
+    "Output ONLY the final revised report. Do not include drafts, scores, or review notes."
+)
+
+CRITIQUE_SYSTEM_PROMPT = "You are a Strict Editor. Review the draft for completeness, accuracy, and adherence to the topic. Rate it 0-100."
+
+SUMMARY_SYSTEM_PROMPT = "Summarize the source content in at most 120 words. Keep facts, figures and names relevant to the topic."
+
+# Using available model from user environment (1.5-flash is 404)
+LLM_MODEL = "gemini-2.5-flash-lite"
+
+@lru_cache(maxsize=None)
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Lazily builds the shared LLM client so importing this module stays cheap."""
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL, 
+        temperature=0,
+        google_api_key=os.getenv("GOOGLE_API_KEY")
+    )
+
+@lru_cache(maxsize=None)
+def get_writer_llm() -> Runnable:
+    """The shared client with a thinking budget for the writer's self-review.
+
+    Thoughts are not returned, so only the final report is streamed.
+    """
+    return get_llm().bind(thinking_budget=WRITER_THINKING_BUDGET)
+
+@lru_cache(maxsize=None)
+def get_json_llm() -> Runnable:
+    """The shared client, constrained to emit JSON for the structured-output chains."""
+    return get_llm().bind(response_mime_type="application/json")
+
+@lru_cache(maxsize=None)
+def get_tools() -> ToolManager:
+    """Lazily builds the shared ToolManager; callers open it with `async with get_tools():`."""
+    return ToolManager()
+
+def json_output_instructions(schema: type) -> str:
+    """Prompt text asking for JSON matching `schema`, escaped for use in a ChatPromptTemplate."""
+    schema_json = msgspec.json.encode(msgspec.json.schema(schema)).decode()
+    text = f"Respond with only a JSON object that conforms to this JSON schema:\n{schema_json}"
+    return text.replace("{", "{{").replace("}", "}}")
+
+def with_json_output(llm, schema: type):
+    """Lightweight stand-in for `llm.with_structured_output(schema)` that decodes with msgspec.
+
+    The prompt must include `json_output_instructions(schema)`. Decoding is lax
+    (e.g. 85.0 is accepted for an int) but still raises `msgspec.MsgspecError`
+    on malformed replies, so callers decide how to recover.
+    """
+    decoder = msgspec.json.Decoder(schema, strict=False)
+
+    def parse(message):
+        text = message.content
+        # Tolerate ```json fences or chatter around the object.
+        start, end = text.find("{"), text.rfind("}")
+        return decoder.decode(text[start:end + 1] if start != -1 else text)
+
+    return llm | RunnableLambda(parse)
+
+# Prompt templates are parsed once at import; the chains that bind them to the
+# (lazily created) LLM are composed once on first use.
+PLANNER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", PLANNER_SYSTEM_PROMPT + "\n\n" + json_output_instructions(ResearchPlan)),
+    ("human", "Topic: {topic}")
+])
+
+WRITER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", WRITER_SYSTEM_PROMPT),
+    ("human", "Topic: {topic}\n\nResearch Data:\n{data}{repair_notes}")
+])
+
+CRITIQUE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CRITIQUE_SYSTEM_PROMPT + "\n\n" + json_output_instructions(Feedback)),
+    ("human", "Topic: {topic}\n\nDraft:\n{draft}")
+])
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SUMMARY_SYSTEM_PROMPT),
+    ("human", "Topic: {topic}\n\nContent:\n{content}")
+])
+
+@lru_cache(maxsize=None)
+def get_planner_chain():
+    return PLANNER_PROMPT | with_json_output(get_json_llm(), ResearchPlan)
+
+@lru_cache(maxsize=None)
+def get_writer_chain():
+    return WRITER_PROMPT | get_writer_llm()
+
+@lru_cache(maxsize=None)
+def get_critique_chain():
+    return CRITIQUE_PROMPT | with_json_output(get_json_llm(), Feedback)
+
+@lru_cache(maxsize=None)
+def get_summary_chain():
+    return SUMMARY_PROMPT | get_llm()
+
+Emitter = Callable[[Dict[str, Any]], Awaitable[None]]
+
+async def _noop_emit(frame: Dict[str, Any]) -> None:
+    return None
+
+def get_emitter(config: Optional[RunnableConfig]) -> Emitter:
+    """Returns the frame emitter passed in via `configurable`, or a no-op when running headless."""
+    configurable = (config or {}).get("configurable") or {}
+    return configurable.get("emit") or _noop_emit
+
+@lru_cache(maxsize=None)
+def _get_tokenizer():
+    # cl100k is not Gemini's tokenizer, but it is close enough for budgeting.
+    # The first call downloads its BPE file, so warm_tokenizer() runs it at startup.
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: tiktoken unavailable, estimating tokens from length: {e}")
+        return None
+
+def warm_tokenizer():
+    """Loads the tokenizer ahead of time so no graph node pays for (or blocks on) the download."""
+    _get_tokenizer()
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4
+    return len(tokenizer.encode(text))
+
+def clean_snippet(content: str) -> str:
+    """Strips HTML markup from a search result and truncates it to MAX_SNIPPET_BYTES."""
+    if _HTML_TAG_RE.search(content):
+        try:
+            root = lxml.html.fromstring(content)
+            if root.tag in ("script", "style"):
+                content = ""
+            else:
+                # Script and style bodies aren't prose; join text nodes with spaces
+                # so adjacent block elements don't run together.
+                for el in root.xpath("//script|//style"):
+                    el.drop_tree()
+                content = _WHITESPACE_RE.sub(" ", " ".join(root.itertext())).strip()
+        except Exception:
+            pass  # Not parseable as HTML; keep the raw text
 
-tools = ToolManager()
+    encoded = content.encode("utf-8")
+    if len(encoded) > MAX_SNIPPET_BYTES:
+        content = encoded[:MAX_SNIPPET_BYTES].decode("utf-8", errors="ignore")
+    return content
 
-def check_memory_node(state: AgentState) -> AgentState:
+def _format_source(d: Dict) -> str:
+    return f"Source: {d['source']}\nContent: {d['content']}"
+
+def _select_research_data(state: AgentState) -> Tuple[List[Dict], List[Dict]]:
+    """Splits research data into what fits the writer budget (best score first) and the overflow."""
+    records = [
+        {"source": source, "content": content, "score": score}
+        for source, content, score in zip(state['sources'], state['contents'], state['scores'])
+    ]
+
+    # Retries append the same sources again; keep the best-scored copy of each.
+    unique: Dict[str, Dict] = {}
+    for d in records:
+        if d['source'] not in unique or d.get('score', 0) > unique[d['source']].get('score', 0):
+            unique[d['source']] = d
+
+    kept, overflow = [], []
+    used = 0
+    for d in sorted(unique.values(), key=lambda d: d.get('score', 0), reverse=True):
+        tokens = count_tokens(_format_source(d))
+        if used + tokens <= WRITER_CONTEXT_TOKEN_BUDGET:
+            kept.append(d)
+            used += tokens
+        else:
+            overflow.append(d)
+    return kept, overflow
+
+async def _summarize_sources(topic: str, sources: List[Dict]) -> List[Dict]:
+    """Condenses overflow sources with a short, concurrency-limited LLM pass each."""
+    chain = get_summary_chain()
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize(d: Dict) -> Dict:
+        async with semaphore:
+            summary = await chain.ainvoke({"topic": topic, "content": d['content']})
+            return {**d, "content": summary.content}
+
+    return await asyncio.gather(*[summarize(d) for d in sources])
+
+async def build_data_summary(state: AgentState) -> Tuple[str, str]:
+    """Returns the writer's research context and a key identifying the selected sources."""
+    kept, overflow = _select_research_data(state)
+
+    key_material = "\n".join(_format_source(d) for d in kept + overflow)
+    key = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    # Critique retries usually come back with the same sources; don't summarize them twice.
+    if key == state.get('data_summary_key') and state.get('data_summary'):
+        return state['data_summary'], key
+
+    if overflow:
+        kept = kept + await _summarize_sources(state['topic'], overflow)
+    return "\n\n".join(_format_source(d) for d in kept), key
+
+async def check_memory_node(state: AgentState) -> Dict[str, Any]:
     """Checks if the topic exists in Supabase memory."""
     print(f"--- Checking Memory for: {state['topic']} ---")
-    existing_data = tools.check_memory(state['topic'])
+    tools = get_tools()
+    topic_embedding = await tools.embed_text(state['topic'])
+    existing_data = await tools.check_memory(state['topic'], topic_embedding)
     
     if existing_data:
         print("--- Memory Hit! Returning cached report. ---")
         return {
-            **state, 
             "memory_hit": True, 
             "final_report": existing_data.get('content', {}).get('report', 'No report content found.') if isinstance(existing_data.get('content'), dict) else existing_data.get('content'),
             "logs": ["--- Memory Hit! Returning cached report. ---"]
         }
     
     print("--- No Memory Found. Proceeding to Plan. ---")
-    return {**state, "memory_hit": False, "logs": [f"Checking Memory for: {state['topic']}", "--- No Memory Found. Proceeding to Plan. ---"]}
+    return {"memory_hit": False, "topic_embedding": topic_embedding, "logs": [f"Checking Memory for: {state['topic']}", "--- No Memory Found. Proceeding to Plan. ---"]}
 
-def planner_node(state: AgentState) -> AgentState:
+async def planner_node(state: AgentState) -> Dict[str, Any]:
     """Generates a research plan based on the topic."""
     print("--- Planning Research ---")
     
-    # Structured output binding
-    planner_llm = llm.with_structured_output(ResearchPlan)
+    try:
+        plan: ResearchPlan = await get_planner_chain().ainvoke({"topic": state['topic']})
+    except msgspec.MsgspecError as e:
+        # An unusable plan shouldn't sink the run; research the topic itself instead.
+        print(f"Plan could not be decoded: {e}")
+        plan = ResearchPlan(queries=[SearchQuery(query=state['topic'], rationale="Fallback: planner reply was not valid JSON.")])
     
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a Senior Research Planner. Breakdown the user topic into 3-5 distinct, actionable search queries to gather comprehensive information."),
-        ("human", "Topic: {topic}")
-    ])
-    
-    chain = prompt | planner_llm
-    plan: ResearchPlan = chain.invoke({"topic": state['topic']})
-    
-    return {**state, "plan": plan.queries, "research_data": [], "logs": ["--- Planning Research ---", f"Generated {len(plan.queries)} search queries."], "current_query_index": 0}
+    return {"plan": plan.queries, "logs": ["--- Planning Research ---", f"Generated {len(plan.queries)} search queries."]}
 
-def researcher_node(state: AgentState) -> AgentState:
-    """Executes the research plan using Tavily and Firecrawl."""
+async def researcher_node(state: AgentState) -> Dict[str, Any]:
+    """Executes every query in the research plan concurrently, reusing cached results where possible."""
     queries = state['plan']
-    current_index = state.get('current_query_index', 0)
-    
-    if current_index >= len(queries):
-        return {"logs": ["All queries completed."]} # Should be handled by conditional edge, but safety check.
+    tools = get_tools()
+    semaphore = asyncio.Semaphore(PLAN_CONCURRENCY)
 
-    q = queries[current_index]
-    log_buffer = [f"--- Researching Query {current_index + 1}/{len(queries)}: {q.query} ---"]
-    print(f"Searching: {q.query}")
-    
-    results = tools.search_tavily(q.query)
-    
-    new_data = []
-    for result in results[:2]:
-        content = result.get('content', '')
-        url = result.get('url', '')
-        
-        new_data.append({
-            "source": url,
-            "content": content,
-            "query": q.query
-        })
+    def trim(results):
+        # Only the results we use, with bounded text; this is also what gets cached.
+        return [
+            {**r, "content": clean_snippet(r.get('content', ''))}
+            for r in results[:RESULTS_PER_QUERY]
+        ]
+
+    async def run_query(q, embedding):
+        async with semaphore:
+            if embedding is not None:
+                cached = await tools.lookup_query_cache(embedding)
+                if cached is not None:
+                    print(f"Cache hit: {q.query}")
+                    # Entries cached before trimming existed may still be raw
+                    return trim(cached), True
+
+            print(f"Searching: {q.query}")
+            results = trim(await tools.search_tavily(q.query))
+            # Don't cache empty results or the placeholders search_tavily returns on failure,
+            # and keep the upsert off the critical path.
+            if embedding is not None and results and not any(r.get('url') == "error" for r in results):
+                tools.run_in_background(tools.save_query_cache(q.query, embedding, results))
+            return results, False
+
+    # One batched embedding call for the whole plan instead of one round-trip per query.
+    embeddings = await tools.embed_batch([q.query for q in queries])
+    if not embeddings:
+        embeddings = [None] * len(queries)
+
+    all_results = await asyncio.gather(*[run_query(q, e) for q, e in zip(queries, embeddings)])
+
+    log_buffer = [f"--- Researching {len(queries)} Queries in Parallel ---"]
+    sources, contents, query_texts, scores = [], [], [], []
+    for q, (results, cache_hit) in zip(queries, all_results):
+        log_buffer.append(f"Cache hit: {q.query}" if cache_hit else f"Searching: {q.query}")
+        for result in results:
+            sources.append(result.get('url', ''))
+            contents.append(result['content'])
+            query_texts.append(q.query)
+            scores.append(result.get('score', 0))
 
     # Return only the updates. 
-    # research_data is Annotated with add, so we return the list of NEW items.
-    # logs is Annotated with add, so we return NEW logs.
-    # current_query_index is overwritten.
+    # The research columns and logs are Annotated with add, so we return only NEW items.
     return {
-        "research_data": new_data, 
-        "logs": log_buffer,
-        "current_query_index": current_index + 1
+        "sources": sources,
+        "contents": contents,
+        "queries": query_texts,
+        "scores": scores,
+        "logs": log_buffer
     }
 
-def writer_node(state: AgentState) -> AgentState:
-    """Synthesizes research data into a report."""
+async def writer_node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """Synthesizes research data into a report, streaming tokens to the client as they arrive."""
     print("--- Writing Draft ---")
-    data_summary = "\n\n".join([f"Source: {d['source']}\nContent: {d['content']}" for d in state['research_data']])
+    data_summary, data_summary_key = await build_data_summary(state)
     
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a Professional Technical Writer. Synthesize the provided research data into a comprehensive Markdown report. \\n\\n"
-                   "Follow these rules STRICTLY:\\n"
-                   "1. Start with a clear level 1 header (# Title) for the report title.\\n"
-                   "2. Use level 2 headers (## Section) for main sections and level 3 (### Subsection) for subsections.\\n"
-                   "3. Use bolding (**bold**) for key terms and important concepts.\\n"
-                   "4. Ensure there is a blank line between every paragraph and list item for proper spacing.\\n"
-                   "5. Use bullet points for lists of features or takeaways.\\n"
-                   "6. Cite sources inline using [Source Title](URL) format.\\n"
-                   "7. Add a 'References' section at the end.\\n"
-                   "8. Do NOT output raw text blocks without formatting. Make it visually structured and easy to read."),
-        ("human", "Topic: {topic}\n\nResearch Data:\n{data}")
-    ])
-    
-    chain = prompt | llm
-    draft = chain.invoke({"topic": state['topic'], "data": data_summary})
+    # A repair pass tells the writer what the structural gate rejected last time.
+    repairing = not state.get('structural_ok', True)
+    repair_notes = ""
+    if repairing:
+        repair_notes = f"\n\nYour previous draft was rejected. {state['critique_feedback']} Fix these problems in this version."
+
+    chain = get_writer_chain()
+    emit = get_emitter(config)
+
+    # Tell the client a fresh draft starts, then stream deltas out immediately;
+    # only the accumulated text goes into state.
+    await emit({"type": "draft_start"})
+    chunks: List[str] = []
+    async for chunk in chain.astream({"topic": state['topic'], "data": data_summary, "repair_notes": repair_notes}):
+        if chunk.content:
+            chunks.append(chunk.content)
+            await emit({"type": "token", "delta": chunk.content})
+    draft = "".join(chunks)
     
-    return {**state, "draft": draft.content, "logs": ["--- Writing Draft ---", "Draft generated."]}
+    update = {"draft": draft, "data_summary": data_summary, "data_summary_key": data_summary_key, "logs": ["--- Writing Draft ---", "Draft generated."]}
+    if repairing:
+        update["repair_count"] = state.get('repair_count', 0) + 1
+    return update
+
+# Structural rules for drafts, one pattern per rule. They are OR-ed into a single
+# pattern so the draft is scanned once; `lastgroup` tells which rule matched.
+_REFS_RE = re.compile(r'^#{1,3}[ \t]+references\b', re.M | re.I)
+_HEADER_RE = re.compile(r'^#{1,3} ', re.M)
+_CITE_RE = re.compile(r'\[[^\]]+\]\(https?://')
+_STRUCTURE_RE = re.compile(
+    f"(?P<refs>{_REFS_RE.pattern})|(?P<header>{_HEADER_RE.pattern})|(?P<cite>{_CITE_RE.pattern})",
+    re.M | re.I
+)
+
+def structural_issues(draft: str) -> List[str]:
+    """Cheap checks for the writer's formatting rules; returns a list of problems found."""
+    counts = {"refs": 0, "header": 0, "cite": 0}
+    for match in _STRUCTURE_RE.finditer(draft):
+        counts[match.lastgroup] += 1
 
-def critique_node(state: AgentState) -> AgentState:
-    """Reviews the draft for quality and hallucinations."""
+    issues = []
+    # A References heading is a header too; it just matched the more specific rule first.
+    if counts["header"] + counts["refs"] < 2:
+        issues.append("missing title/section headers")
+    if not counts["refs"]:
+        issues.append("missing References section")
+    if not counts["cite"]:
+        issues.append("no inline citations")
+    if count_tokens(draft) < MIN_DRAFT_TOKENS:
+        issues.append("draft too short")
+    return issues
+
+async def critique_node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """Reviews the draft for quality and hallucinations and sends the critique text to the client."""
     print("--- Critiquing Draft ---")
-    
-    critique_llm = llm.with_structured_output(Feedback)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a Strict Editor. Review the draft for completeness, accuracy, and adherence to the topic. Rate it 0-100."),
-        ("human", "Topic: {topic}\n\nDraft:\n{draft}")
-    ])
-    
-    chain = prompt | critique_llm
-    feedback: Feedback = chain.invoke({"topic": state['topic'], "draft": state['draft']})
-    
+    emit = get_emitter(config)
     count = state.get('critique_count', 0) + 1
+
+    # Reject structurally broken drafts locally and save a Gemini round-trip.
+    issues = structural_issues(state['draft'])
+    if issues:
+        critique = f"Draft failed structural checks: {', '.join(issues)}."
+        await emit({"type": "critique", "delta": critique})
+        # Not counted against the critique budget; the graph routes this to a writer repair pass.
+        return {
+            "structural_ok": False,
+            "critique_score": STRUCTURAL_FAIL_SCORE,
+            "critique_feedback": critique,
+            "logs": ["--- Critiquing Draft ---", critique, f"Critique Score: {STRUCTURAL_FAIL_SCORE}/100"]
+        }
+
+    # With no retry left, an LLM score can't change the outcome; don't pay for it.
+    if count >= MAX_CRITIQUE_ROUNDS:
+        return {
+            "structural_ok": True,
+            "critique_count": count,
+            "logs": ["--- Critiquing Draft ---", "Structural checks passed."]
+        }
+    
+    # The JSON reply is decoded in one piece, so the critique goes out as a single frame.
+    try:
+        feedback: Feedback = await get_critique_chain().ainvoke({"topic": state['topic'], "draft": state['draft']})
+    except msgspec.MsgspecError as e:
+        print(f"Critique could not be decoded: {e}")
+        feedback = Feedback(
+            score=UNPARSED_CRITIQUE_SCORE,
+            critique="Editor feedback was unavailable (reply was not valid JSON).",
+            hallucination_check=False
+        )
+    await emit({"type": "critique", "delta": feedback.critique})
     
     return {
-        **state, 
+        "structural_ok": True,
         "critique_score": feedback.score, 
         "critique_feedback": feedback.critique,
         "critique_count": count,
-        "logs": ["--- Critiquing Draft ---", f"Critique Score: {feedback.score}/100"],
-        "current_query_index": 0
+        "logs": ["--- Critiquing Draft ---", f"Critique Score: {feedback.score}/100"]
     }
 
-def save_memory_node(state: AgentState) -> AgentState:
-    """Saves the final authorized report to Supabase."""
-    print("--- Saving to Memory ---")
-    # If we are here, the report is finalized (either good score or max retries)
-    final_content = state['draft']
-    tools.save_memory(state['topic'], final_content)
-    return {**state, "final_report": final_content, "logs": ["--- Saving to Memory ---", "Report saved to database."]}
+async def finalize_node(state: AgentState) -> Dict[str, Any]:
+    """Marks the current draft as the final report.
+
+    Persisting it to Supabase is left to the caller, which does it after the
+    report has been delivered so the DB write never delays the user. Drafts
+    that still fail the structural checks are delivered but never persisted,
+    so they can't be served from memory for other topics.
+    """
+    print("--- Finalizing Report ---")
+    # If we are here, the report is finalized (good score, spent budget, or spent repairs)
+    if not state.get('structural_ok', True):
+        return {
+            "final_report": state['draft'],
+            "persist_report": False,
+            "logs": ["--- Finalizing Report ---", "Report still fails structural checks; it will not be saved to memory."]
+        }
+    return {"final_report": state['draft'], "persist_report": True, "logs": ["--- Finalizing Report ---", "Report ready."]}
@@ -12,6 +12,9 @@ const WEBSOCKET_URL = import.meta.env.PROD
     ? "wss://advance-reasoning-with-sources.onrender.com/ws"
     : "ws://localhost:8000/ws";
 
+// Frames arrive as binary UTF-8 JSON: { type: 'update' | 'draft_start' | 'token' | 'draft_delta' | 'critique' | 'complete' | 'error', ... }
+const frameDecoder = new TextDecoder('utf-8');
+
 // Utility for merging classes
 function cn(...inputs) {
     return twMerge(clsx(inputs));
@@ -103,6 +106,8 @@ export default function Home() {
         setConnectionStatus('connecting');
 
         ws.current = new WebSocket(WEBSOCKET_URL);
+        // The server sends every frame as binary UTF-8 JSON (orjson + send_bytes).
+        ws.current.binaryType = 'arraybuffer';
 
         ws.current.onopen = () => {
             setConnectionStatus('connected');
@@ -112,7 +117,8 @@ export default function Home() {
 
         ws.current.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const raw = typeof event.data === 'string' ? event.data : frameDecoder.decode(event.data);
+                const data = JSON.parse(raw);
                 handleMessage(data);
             } catch (e) {
                 console.error("Parse error", e);
@@ -133,7 +139,16 @@ export default function Home() {
     };
 
     const handleMessage = (data) => {
-        if (data.type === 'update') {
+        if (data.type === 'draft_start') {
+            // The writer is starting a fresh draft (research retry or structural repair).
+            setReport(null);
+        } else if (data.type === 'token' || data.type === 'draft_delta') {
+            // Live writer output; the 'complete' frame replaces it with the final report.
+            setReport(prev => (prev ?? '') + data.delta);
+        } else if (data.type === 'critique') {
+            // Editor feedback on the current draft, shown in the system log.
+            addLog('agent', `Critique: ${data.delta}`, 'critique');
+        } else if (data.type === 'update') {
             if (data.logs && Array.isArray(data.logs)) {
                 data.logs.forEach(msg => addLog('agent', msg, data.node));
             } else {
@@ -1,4 +1,5 @@
 import sys
+import asyncio
 from langgraph.graph import StateGraph, END
 from state import AgentState
 from agents import (
@@ -7,7 +8,11 @@ from agents import (
     researcher_node, 
     writer_node, 
     critique_node, 
-    save_memory_node
+    finalize_node,
+    get_tools,
+    warm_tokenizer,
+    MAX_CRITIQUE_ROUNDS,
+    MAX_REPAIR_PASSES
 )
 
 def build_graph():
@@ -20,7 +25,7 @@ def build_graph():
     workflow.add_node("researcher", researcher_node)
     workflow.add_node("writer", writer_node)
     workflow.add_node("critique", critique_node)
-    workflow.add_node("save_memory", save_memory_node)
+    workflow.add_node("finalize", finalize_node)
 
     # Add Edges
     workflow.set_entry_point("check_memory")
@@ -42,31 +47,23 @@ def build_graph():
 
     # Normal Edges
     workflow.add_edge("planner", "researcher")
-    
-    # Conditional Loop for Researcher
-    def research_condition(state: AgentState):
-        if state.get("current_query_index", 0) < len(state.get("plan", [])):
-            return "continue"
-        return "done"
-
-    workflow.add_conditional_edges(
-        "researcher",
-        research_condition,
-        {
-            "continue": "researcher",
-            "done": "writer"
-        }
-    )
-    
+    workflow.add_edge("researcher", "writer")
     workflow.add_edge("writer", "critique")
 
     # Conditional Edge from Critique
     def critique_condition(state: AgentState):
         score = state.get("critique_score", 0)
         count = state.get("critique_count", 0)
+
+        # A structurally broken draft goes back to the writer for a repair pass.
+        # Once repairs are spent it is delivered but not persisted (see finalize_node).
+        if not state.get("structural_ok", True):
+            if state.get("repair_count", 0) < MAX_REPAIR_PASSES:
+                return "rewrite"
+            return "good"
         
-        # If score is good (>70) or retried too many times (>3), stop.
-        if score > 70 or count > 3:
+        # If the critique budget is spent or the score is good (>70), stop.
+        if count >= MAX_CRITIQUE_ROUNDS or (score or 0) > 70:
             return "good"
         return "retry"
 
@@ -74,15 +71,34 @@ def build_graph():
         "critique",
         critique_condition,
         {
-            "good": "save_memory",
+            "good": "finalize",
+            "rewrite": "writer",
             "retry": "researcher" # Back to research (or could go to writer, but gathering more info is usually better)
         }
     )
 
-    workflow.add_edge("save_memory", END)
+    workflow.add_edge("finalize", END)
 
     return workflow.compile()
 
+async def run_graph(app, initial_state) -> str:
+    """Runs the graph to completion, saves a freshly written report and returns it."""
+    final_report = "No report generated."
+    topic_embedding = None
+    async with get_tools() as tools:
+        async for output in app.astream(initial_state):
+            for key, value in output.items():
+                print(f"Finished Node: {key}")
+                if "topic_embedding" in value:
+                    topic_embedding = value["topic_embedding"]
+                if "final_report" in value and value["final_report"]:
+                    final_report = value["final_report"]
+                # Save the finalize node's own report; never the placeholder, an empty one,
+                # or one that failed the structural checks
+                if key == "finalize" and value.get("final_report") and value.get("persist_report"):
+                    await tools.save_memory(initial_state["topic"], value["final_report"], topic_embedding)
+    return final_report
+
 def run_cli():
     print("=== P7 Autonomous Research Agent ===")
     app = build_graph()
@@ -93,27 +109,27 @@ def run_cli():
         return
 
     print(f"\nStarting research on: {topic}...\n")
+    warm_tokenizer()
     
     initial_state = {
         "topic": topic,
         "plan": [],
-        "research_data": [],
+        "sources": [],
+        "contents": [],
+        "queries": [],
+        "scores": [],
         "draft": "",
         "critique_count": 0,
         "critique_score": 0,
+        "structural_ok": True,
+        "repair_count": 0,
         "memory_hit": False,
-        "final_report": "",
-        "current_query_index": 0
+        "final_report": ""
     }
     
     try:
-        final_report = "No report generated."
-        # Run the graph
-        for output in app.stream(initial_state):
-            for key, value in output.items():
-                print(f"Finished Node: {key}")
-                if "final_report" in value and value["final_report"]:
-                    final_report = value["final_report"]
+        # Run the graph (all nodes are async, so drive it with astream)
+        final_report = asyncio.run(run_graph(app, initial_state))
         
         print("\n=== FINAL REPORT ===\n")
         print(final_report)
@@ -1,11 +1,51 @@
 -- Run this in your Supabase SQL Editor
 
-create table public.research_logs (
+create extension if not exists vector;
+
+create table if not exists public.research_logs (
   id uuid default gen_random_uuid() primary key,
   topic text not null,
   content jsonb not null,
+  topic_embedding vector(768),
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
--- Optional: Enable Vector extension if you plan to use embeddings later
--- create extension if not exists vector;
+-- Migration for deployments created before the embedding column existed
+alter table public.research_logs add column if not exists topic_embedding vector(768);
+
+-- Semantic memory: near-duplicate topics hit the cache instead of re-running research
+create index if not exists research_logs_topic_embedding_idx on public.research_logs
+  using hnsw (topic_embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
+
+create or replace function public.match_research_logs(query_embedding vector(768), match_count int)
+returns table (id uuid, topic text, content jsonb, similarity float)
+language sql stable
+as $$
+  select id, topic, content, 1 - (topic_embedding <=> query_embedding) as similarity
+  from public.research_logs
+  where topic_embedding is not null
+  order by topic_embedding <=> query_embedding
+  limit match_count;
+$$;
+
+-- Per-query search cache: plan queries similar to an earlier one reuse its results
+create table if not exists public.query_cache (
+  id uuid default gen_random_uuid() primary key,
+  query_text text not null unique,
+  embedding vector(768) not null,
+  results_json jsonb not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create index if not exists query_cache_embedding_idx on public.query_cache
+  using hnsw (embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
+
+create or replace function public.match_query_cache(query_embedding vector(768), match_count int)
+returns table (query_text text, results_json jsonb, similarity float)
+language sql stable
+as $$
+  select query_text, results_json, 1 - (embedding <=> query_embedding) as similarity
+  from public.query_cache
+  order by embedding <=> query_embedding
+  limit match_count;
+$$;
@@ -1,10 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import json
+import orjson
 from main import build_graph
+from agents import get_tools, warm_tokenizer
 
-app = FastAPI()
+def schedule_save(topic: str, report: str, topic_embedding):
+    """Persists a finished report without holding up the WebSocket response."""
+    get_tools().run_in_background(get_tools().save_memory(topic, report, topic_embedding))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the tokenizer once, off the event loop, before any session needs it
+    await asyncio.to_thread(warm_tokenizer)
+
+    # Keep the shared HTTP/2 and Supabase clients open for the server's lifetime
+    # (pending background saves are drained when they close)
+    async with get_tools():
+        yield
+
+app = FastAPI(lifespan=lifespan)
+APP_GRAPH = build_graph()
 
 
 app.add_middleware(
@@ -23,57 +41,89 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     try:
         data = await websocket.receive_text()
-        request = json.loads(data)
+        request = orjson.loads(data)
         topic = request.get("topic")
 
         if not topic:
-            await websocket.send_text(json.dumps({"type": "error", "message": "No topic provided"}))
+            await websocket.send_bytes(orjson.dumps({"type": "error", "message": "No topic provided"}))
             return
 
-        workflow = build_graph()
-        
         initial_state = {
             "topic": topic,
             "plan": [],
-            "research_data": [],
+            "sources": [],
+            "contents": [],
+            "queries": [],
+            "scores": [],
             "draft": "",
             "critique_count": 0,
             "critique_score": 0,
+            "structural_ok": True,
+            "repair_count": 0,
             "memory_hit": False,
-            "final_report": "",
-            "current_query_index": 0
+            "final_report": ""
         }
 
+        # How much of the current draft the client already has (streamed tokens + draft deltas)
+        last_sent_draft_len = 0
+
+        async def emit(frame: dict):
+            nonlocal last_sent_draft_len
+            if frame["type"] == "draft_start":
+                # The writer is starting a new draft (research retry or repair pass)
+                last_sent_draft_len = 0
+            elif frame["type"] == "token":
+                last_sent_draft_len += len(frame["delta"])
+            await websocket.send_bytes(orjson.dumps(frame))
+
         # Stream the graph execution
         final_report = "No report generated."
+        report_to_save = None
+        topic_embedding = None
         
-        for event in workflow.stream(initial_state):
+        async for event in APP_GRAPH.astream(initial_state, config={"configurable": {"emit": emit}}):
             for node_name, state_update in event.items():
                 
                 # Capture final report if present in update
                 if "final_report" in state_update and state_update["final_report"]:
                     final_report = state_update["final_report"]
-                
-                # Send update to client
+                if node_name == "finalize" and state_update.get("persist_report"):
+                    # Never fall back to the placeholder; an empty report is not saved
+                    report_to_save = state_update.get("final_report")
+                if "topic_embedding" in state_update:
+                    topic_embedding = state_update["topic_embedding"]
+
+                # Send update to client (the draft travels separately as deltas)
                 response = {
                     "type": "update",
                     "node": node_name,
                     "status": f"Finished {node_name}",
                     "logs": state_update.get("logs", []),
-                    "sources": [d['source'] for d in state_update.get("research_data", [])] if "research_data" in state_update else [],
-                    "plan": [p.query for p in state_update.get("plan", [])] if "plan" in state_update else None,
-                    "draft": state_update.get("draft") if "draft" in state_update else None
+                    "sources": state_update.get("sources", []),
+                    "plan": [p.query for p in state_update.get("plan", [])] if "plan" in state_update else None
                 }
-                await websocket.send_text(json.dumps(response))
+                await websocket.send_bytes(orjson.dumps(response))
+
+                draft = state_update.get("draft")
+                if draft and len(draft) > last_sent_draft_len:
+                    await websocket.send_bytes(orjson.dumps({
+                        "type": "draft_delta",
+                        "delta": draft[last_sent_draft_len:]
+                    }))
+                    last_sent_draft_len = len(draft)
         
-        await websocket.send_text(json.dumps({
+        await websocket.send_bytes(orjson.dumps({
             "type": "complete",
             "report": final_report
         }))
 
+        # Only freshly written reports are saved; memory hits are already stored
+        if report_to_save:
+            schedule_save(topic, report_to_save, topic_embedding)
+
     except Exception as e:
         print(f"Error: {e}")
-        await websocket.send_text(json.dumps({"type": "error", "message": str(e)}))
+        await websocket.send_bytes(orjson.dumps({"type": "error", "message": str(e)}))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,34 +1,44 @@
 from typing import List, Dict, TypedDict, Optional, Annotated
 import operator
-from pydantic import BaseModel, Field
+import msgspec
 
-# Pydantic Models for Structured Output
-class SearchQuery(BaseModel):
-    query: str = Field(description="A specific search query to gather information.")
-    rationale: str = Field(description="Why this query is important.")
+# msgspec Structs for Structured Output (decoded straight from the LLM's JSON)
+class SearchQuery(msgspec.Struct):
+    query: Annotated[str, msgspec.Meta(description="A specific search query to gather information.")]
+    rationale: Annotated[str, msgspec.Meta(description="Why this query is important.")]
 
-class ResearchPlan(BaseModel):
-    queries: List[SearchQuery] = Field(description="List of search queries to execute.")
+class ResearchPlan(msgspec.Struct):
+    queries: Annotated[List[SearchQuery], msgspec.Meta(description="List of search queries to execute.")]
 
-class Citation(BaseModel):
-    source_id: str = Field(description="The url or title of the source.")
-    text: str = Field(description="The specific fact or quote being cited.")
+class Citation(msgspec.Struct):
+    source_id: Annotated[str, msgspec.Meta(description="The url or title of the source.")]
+    text: Annotated[str, msgspec.Meta(description="The specific fact or quote being cited.")]
 
-class Feedback(BaseModel):
-    score: int = Field(description="Quality score from 0 to 100.")
-    critique: str = Field(description="Detailed feedback on what is missing or incorrect.")
-    hallucination_check: bool = Field(description="True if potential hallucinations are found.")
+class Feedback(msgspec.Struct):
+    score: Annotated[int, msgspec.Meta(description="Quality score from 0 to 100.")]
+    critique: Annotated[str, msgspec.Meta(description="Detailed feedback on what is missing or incorrect.")]
+    hallucination_check: Annotated[bool, msgspec.Meta(description="True if potential hallucinations are found.")]
 
 # LangGraph State
 class AgentState(TypedDict):
     topic: str
     plan: List[SearchQuery]
-    research_data: Annotated[List[Dict], operator.add] # Append-only list of gathered info
+    # Gathered research, stored column-wise (index i of each list is one search result).
+    # Only the short `sources` column is sent to the client; `contents` stays server-side.
+    sources: Annotated[List[str], operator.add] # Result URLs
+    contents: Annotated[List[str], operator.add] # Result text
+    queries: Annotated[List[str], operator.add] # Plan query that produced each result
+    scores: Annotated[List[float], operator.add] # Tavily relevance score
+    data_summary: Optional[str] # Budgeted research context last given to the writer
+    data_summary_key: Optional[str] # Hash of the sources behind data_summary
     draft: str
     critique_count: int
     critique_score: Optional[int]
     critique_feedback: Optional[str]
+    structural_ok: bool # False when the last draft failed structural_issues()
+    repair_count: int # Writer passes spent fixing structural failures
     final_report: Optional[str]
+    persist_report: bool # Whether final_report may be saved to memory
     memory_hit: bool # Flag if topic was found in Supabase
+    topic_embedding: Optional[List[float]] # Topic vector, reused when saving to memory
     logs: Annotated[List[str], operator.add] # Log messages
-    current_query_index: int # helper to iterate over queries
@@ -1,21 +1,41 @@
 import os
-import json
-from typing import List, Dict, Optional
-from tavily import TavilyClient
+import asyncio
+from typing import List, Dict, Optional, Set, Coroutine
+import httpx
 from firecrawl import FirecrawlApp
-from supabase import create_client, Client
+from supabase import acreate_client, AsyncClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_BATCH_URL = f"https://generativelanguage.googleapis.com/v1beta/{EMBEDDING_MODEL}:batchEmbedContents"
+
+# Minimum cosine similarity (1 - distance) for a stored topic to count as a memory hit.
+MEMORY_SIMILARITY_THRESHOLD = 0.92
+
+# Stricter threshold for reusing search results of an individual plan query.
+QUERY_CACHE_SIMILARITY_THRESHOLD = 0.95
+
 class ToolManager:
+    """Async access to Tavily, Firecrawl, Supabase and Google embeddings.
+
+    Network clients are opened in `__aenter__` and shared across every call,
+    so use it as `async with tools:` around graph runs.
+    """
+
     def __init__(self):
-        # Initialize clients with error handling for missing keys
-        try:
-            self.tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        except Exception as e:
-            print(f"Warning: Tavily client failed to init: {e}")
-            self.tavily = None
+        # Read keys up front; missing ones degrade the matching tool instead of failing.
+        self.tavily_key = os.getenv("TAVILY_API_KEY")
+        if not self.tavily_key:
+            print("Warning: Tavily API key missing.")
+
+        self.google_key = os.getenv("GOOGLE_API_KEY")
+        self.embeddings_enabled = bool(self.google_key)
+        if not self.embeddings_enabled:
+            print("Warning: GOOGLE_API_KEY missing, semantic memory disabled.")
 
         try:
             self.firecrawl = FirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"))
@@ -23,72 +43,183 @@ class ToolManager:
             print(f"Warning: Firecrawl client failed to init: {e}")
             self.firecrawl = None
 
-        try:
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_KEY")
-            if url and key:
-                self.supabase: Client = create_client(url, key)
-            else:
+        self.supabase_url = os.getenv("SUPABASE_URL")
+        self.supabase_key = os.getenv("SUPABASE_KEY")
+        if not (self.supabase_url and self.supabase_key):
+            print("Warning: Supabase credentials missing.")
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self.supabase: Optional[AsyncClient] = None
+        # Strong references to in-flight background writes (asyncio only keeps weak ones)
+        self._background: Set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> "ToolManager":
+        # One HTTP/2 connection pool shared by every Tavily and embedding request.
+        self._client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100),
+            timeout=30.0
+        )
+
+        if self.supabase_url and self.supabase_key:
+            try:
+                self.supabase = await acreate_client(self.supabase_url, self.supabase_key)
+            except Exception as e:
+                print(f"Warning: Supabase client failed to init: {e}")
                 self.supabase = None
-                print("Warning: Supabase credentials missing.")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Let pending background writes finish before the clients are closed
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        self.supabase = None
+
+    def run_in_background(self, coro: Coroutine) -> None:
+        """Schedules a write off the caller's critical path; it is awaited on __aexit__."""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def embed_text(self, text: str) -> Optional[List[float]]:
+        """Embeds text with Google's embedding model for pgvector lookups."""
+        vectors = await self.embed_batch([text])
+        return vectors[0] if vectors else None
+
+    async def embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embeds several texts in a single API call; returns one vector per text."""
+        if not self.embeddings_enabled or not self._client or not texts:
+            return None
+
+        try:
+            response = await self._client.post(
+                EMBEDDING_BATCH_URL,
+                params={"key": self.google_key},
+                json={"requests": [
+                    {
+                        "model": EMBEDDING_MODEL,
+                        "content": {"parts": [{"text": text}]},
+                        "taskType": "RETRIEVAL_QUERY"
+                    }
+                    for text in texts
+                ]}
+            )
+            response.raise_for_status()
+            return [e["values"] for e in response.json()["embeddings"]]
         except Exception as e:
-            print(f"Warning: Supabase client failed to init: {e}")
-            self.supabase = None
+            print(f"Embedding failed: {e}")
+            return None
 
-    def search_tavily(self, query: str) -> List[Dict]:
+    async def search_tavily(self, query: str) -> List[Dict]:
         """Performs a web search using Tavily."""
-        if not self.tavily:
+        if not self.tavily_key:
             return [{"url": "error", "content": "Tavily API key missing."}]
-        
+        if not self._client:
+            return [{"url": "error", "content": "ToolManager is not open."}]
+
         try:
-            response = self.tavily.search(query=query, search_depth="basic")
-            return response.get("results", [])
+            response = await self._client.post(
+                TAVILY_SEARCH_URL,
+                headers={"Authorization": f"Bearer {self.tavily_key}"},
+                json={"query": query, "search_depth": "basic"}
+            )
+            response.raise_for_status()
+            return response.json().get("results", [])
         except Exception as e:
             return [{"url": "error", "content": f"Search failed: {e}"}]
 
-    def scrape_firecrawl(self, url: str) -> str:
+    async def scrape_firecrawl(self, url: str) -> str:
         """Scrapes full markdown content from a URL using Firecrawl."""
         if not self.firecrawl:
             return "Firecrawl API key missing."
-        
+
         try:
-            scrape_result = self.firecrawl.scrape_url(url, params={'formats': ['markdown']})
+            # The Firecrawl SDK is synchronous; keep it off the event loop.
+            scrape_result = await asyncio.to_thread(self.firecrawl.scrape_url, url, params={'formats': ['markdown']})
             return scrape_result.get('markdown', '')
         except Exception as e:
             return f"Scraping failed: {e}"
 
-    def check_memory(self, topic: str) -> Optional[dict]:
-        """Checks Supabase for an existing report on the topic."""
+    async def check_memory(self, topic: str, embedding: Optional[List[float]]) -> Optional[dict]:
+        """Checks Supabase for an existing report on a semantically similar topic.
+
+        `embedding` is the caller's topic vector; pass None (e.g. embedding failed)
+        to use the keyword match instead.
+        """
         if not self.supabase:
             return None
-        
+
         try:
-            # Simple keyword match or exact match for now. 
-            # In a real app, we might use vector search here.
-            response = self.supabase.table("research_logs")\
-                .select("*")\
-                .ilike("topic", f"%{topic}%")\
-                .execute()
-            
-            if response.data and len(response.data) > 0:
-                # Return the most recent match
+            if embedding is None:
+                # No embedding available, fall back to a plain keyword match.
+                response = await self.supabase.table("research_logs")\
+                    .select("*")\
+                    .ilike("topic", f"%{topic}%")\
+                    .execute()
+                return response.data[0] if response.data else None
+
+            # Nearest neighbour over the HNSW index (see match_research_logs in schema.sql)
+            response = await self.supabase.rpc("match_research_logs", {
+                "query_embedding": embedding,
+                "match_count": 1
+            }).execute()
+
+            if response.data and response.data[0]["similarity"] > MEMORY_SIMILARITY_THRESHOLD:
                 return response.data[0]
             return None
         except Exception as e:
             print(f"Memory check failed: {e}")
             return None
 
-    def save_memory(self, topic: str, content: str):
-        """Saves the finished report to Supabase."""
+    async def save_memory(self, topic: str, content: str, embedding: Optional[List[float]] = None):
+        """Saves the finished report (and its topic embedding) to Supabase."""
         if not self.supabase:
             return
-        
+
         try:
             data = {
                 "topic": topic,
                 "content": content
                 # "created_at" is usually auto-generated by Supabase
             }
-            self.supabase.table("research_logs").insert(data).execute()
+            if embedding is not None:
+                data["topic_embedding"] = embedding
+            await self.supabase.table("research_logs").insert(data).execute()
         except Exception as e:
             print(f"Failed to save memory: {e}")
+
+    async def lookup_query_cache(self, embedding: List[float]) -> Optional[List[Dict]]:
+        """Returns cached search results for a semantically equivalent query, if any."""
+        if not self.supabase:
+            return None
+
+        try:
+            response = await self.supabase.rpc("match_query_cache", {
+                "query_embedding": embedding,
+                "match_count": 1
+            }).execute()
+
+            if response.data and response.data[0]["similarity"] > QUERY_CACHE_SIMILARITY_THRESHOLD:
+                return response.data[0]["results_json"]
+            return None
+        except Exception as e:
+            print(f"Query cache lookup failed: {e}")
+            return None
+
+    async def save_query_cache(self, query: str, embedding: List[float], results: List[Dict]):
+        """Upserts search results for a query so later runs can skip the search."""
+        if not self.supabase:
+            return
+
+        try:
+            data = {
+                "query_text": query,
+                "embedding": embedding,
+                "results_json": results
+            }
+            await self.supabase.table("query_cache").upsert(data, on_conflict="query_text").execute()
+        except Exception as e:
+            print(f"Failed to save query cache: {e}")